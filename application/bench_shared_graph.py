@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+from bench_spatial_index import load_stations_csv
+from pathfinding import dijkstra
+from shared_graph import SharedGraph, QueryExecutor, _find_path_worker
+from spatial_index import StationIndex
+
+
+def build_knn_graph(stations, k=4):
+    """Stand-in for build_graph without a database: link each station to its k nearest"""
+    index = StationIndex.from_stations(stations)
+    neighbors, distances = index.query_nearest(index.lats, index.lons, k + 1)
+    graph = defaultdict(list)
+    for i in range(len(index)):
+        for j, distance in zip(neighbors[i][1:], distances[i][1:]):
+            u, v = index.codes[i], index.codes[j]
+            graph[u].append((v, float(distance)))
+            graph[v].append((u, float(distance)))
+    return graph
+
+
+def private_memory_kb():
+    """Memory only this process holds (USS), from /proc, in kB"""
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total
+
+
+# Workers of the baseline pool keep their own dict-of-lists copy
+_worker_copy = None
+
+
+def _copy_worker(graph, stations):
+    global _worker_copy
+    _worker_copy = (graph, stations)
+
+
+def _copy_find_path(pair):
+    dijkstra(_worker_copy[0], *pair)
+    return os.getpid(), private_memory_kb()
+
+
+def _shared_find_path(pair):
+    _find_path_worker(pair)
+    return os.getpid(), private_memory_kb()
+
+
+def run(pool, fn, pairs):
+    start = time.perf_counter()
+    results = pool.map(fn, pairs, 16)
+    elapsed = time.perf_counter() - start
+    memory = {}
+    for pid, kb in results:
+        memory[pid] = max(kb, memory.get(pid, 0))
+    return len(pairs) / elapsed, sum(memory.values()) / len(memory)
+
+
+def main(n_queries=2000):
+    stations = load_stations_csv()
+    graph = build_knn_graph(stations)
+    random.seed(42)
+    codes = list(graph)
+    pairs = [tuple(random.sample(codes, 2)) for _ in range(n_queries)]
+
+    with SharedGraph.create(graph, stations) as shared:
+        print(f"{len(codes)} nodes, {sum(map(len, graph.values()))} edges, "
+              f"shared block {shared.nbytes / 1024:.0f} kB, {n_queries} queries\n")
+        print(f"{'workers':>7} {'copy q/s':>10} {'copy kB/worker':>15} {'shared q/s':>11} {'shared kB/worker':>17}")
+
+        n = 1
+        while n <= os.cpu_count():
+            with multiprocessing.Pool(n, initializer=_copy_worker, initargs=(graph, stations)) as pool:
+                copy_qps, copy_kb = run(pool, _copy_find_path, pairs)
+            with QueryExecutor(shared, n) as executor:
+                shared_qps, shared_kb = run(executor.pool, _shared_find_path, pairs)
+            print(f"{n:>7} {copy_qps:>10.0f} {copy_kb:>15.0f} {shared_qps:>11.0f} {shared_kb:>17.0f}")
+            n *= 2
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
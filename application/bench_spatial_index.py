@@ -0,0 +1,70 @@
+import csv
+import os
+import sys
+import time
+import numpy as np
+
+from pathfinding import haversine, parse_geo_point
+from spatial_index import StationIndex
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+gares_csv_path = os.path.join(script_dir, "..", "sncf-data", "csv", "liste-des-gares.csv")
+
+
+def load_stations_csv():
+    """Same stations dict as build_graph, read from the CSV so no database is needed"""
+    stations = {}
+    with open(gares_csv_path, 'r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f, delimiter=';')
+        for row in reader:
+            coords = parse_geo_point(row['Geo Point'])
+            if coords and row['CODE_UIC'] not in stations:
+                stations[row['CODE_UIC']] = {'name': row['LIBELLE'], 'coords': coords}
+    return stations
+
+
+def linear_nearest(stations, lat, lon, k):
+    distances = sorted((haversine(lat, lon, *s['coords']), code) for code, s in stations.items())
+    return distances[:k]
+
+
+def linear_radius(stations, lat, lon, radius_km):
+    return [code for code, s in stations.items() if haversine(lat, lon, *s['coords']) <= radius_km]
+
+
+def timed(label, n_queries, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms total {elapsed / n_queries * 1e6:9.1f} us/query")
+    return result
+
+
+def main(n_queries=1000, k=5, radius_km=20):
+    stations = load_stations_csv()
+    print(f"{len(stations)} stations, {n_queries} queries, k={k}, radius={radius_km} km\n")
+
+    start = time.perf_counter()
+    index = StationIndex.from_stations(stations)
+    print(f"Index built in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    # Random points over metropolitan France
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(42.5, 51.0, n_queries)
+    lons = rng.uniform(-4.5, 8.0, n_queries)
+
+    linear = timed("nearest, linear scan", n_queries,
+                   lambda: [linear_nearest(stations, lat, lon, k) for lat, lon in zip(lats, lons)])
+    indexed = timed("nearest, grid index", n_queries, lambda: index.query_nearest(lats, lons, k))
+    for expected, distances in zip(linear, indexed[1]):
+        assert np.allclose([d for d, _ in expected], distances)
+
+    linear = timed("radius, linear scan", n_queries,
+                   lambda: [linear_radius(stations, lat, lon, radius_km) for lat, lon in zip(lats, lons)])
+    indexed = timed("radius, grid index", n_queries, lambda: index.query_radius(lats, lons, radius_km))
+    for codes, (indices, _) in zip(linear, indexed):
+        assert sorted(codes) == sorted(index.codes[indices])
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
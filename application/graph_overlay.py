@@ -0,0 +1,289 @@
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+
+from pathfinding import dijkstra
+
+
+class GraphOverlay:
+    """In-memory disruptions on top of a loaded graph
+
+    Edges and stations can be closed, edges re-weighted or penalised, each
+    change optionally expiring after duration seconds. The graph itself is
+    never modified, dijkstra(graph, start, end, overlay) applies the overlay.
+    Edges are undirected, like the graphs built by build_graph.
+
+    On a contracted troncons graph (build_graph(network="troncons")), edge
+    methods also accept a single physical troncon segment, and close_station
+    accepts a junction inside a contracted chain. The change is recorded on
+    the segment and only the contracted edge covering it is re-weighted, to
+    its lightest chain still open. Changes made directly on a contracted edge
+    are kept apart and applied on top of that chain weight, so segment and
+    direct changes never undo each other.
+
+    Listeners (see RouteCache) are told about every change through
+    tightened(edge=..., station=...) when routes can only get worse, and
+    relaxed(edge=..., station=...) when some routes may improve.
+    """
+
+    def __init__(self, graph=None):
+        # (u, v) and (v, u) -> (weight, factor, expiry), weight None means closed
+        self.edges = {}
+        # code_uic -> expiry
+        self.stations = {}
+        # Physical troncons behind a ContractedGraph, empty for other graphs
+        self.chains = getattr(graph, 'chains', {})
+        self.segment_edge = getattr(graph, 'segment_edge', {})
+        self.node_edge = getattr(graph, 'node_edge', {})
+        # Changes on physical segments, on contracted edges and on chain
+        # junctions, same layouts as above
+        self.segments = {}
+        self.direct = {}
+        self.junctions = {}
+        self._expiries = []
+        self._counter = itertools.count()
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event, edge=None, station=None):
+        for listener in self._listeners:
+            getattr(listener, event)(edge=edge, station=station)
+
+    def _push_expiry(self, duration, kind, key):
+        if duration is None:
+            return None
+        expiry = time.monotonic() + duration
+        heapq.heappush(self._expiries, (expiry, next(self._counter), kind, key))
+        return expiry
+
+    def _set_edge(self, u, v, weight, factor, duration, tightening):
+        # Replacing an existing change may undo a closure, so it counts as relaxing
+        replaced = (u, v) in self.edges
+        expiry = self._push_expiry(duration, 'edge', (u, v))
+        self.edges[(u, v)] = self.edges[(v, u)] = (weight, factor, expiry)
+        self._notify('tightened' if tightening and not replaced else 'relaxed', edge=(u, v))
+
+    def _clear_edge(self, u, v):
+        if self.edges.pop((u, v), None) is not None:
+            self.edges.pop((v, u), None)
+            self._notify('relaxed', edge=(u, v))
+
+    def _chain_key(self, u, v):
+        """Key of the contracted edge between u and v in chains, None if it has none"""
+        if (u, v) in self.chains:
+            return u, v
+        if (v, u) in self.chains:
+            return v, u
+        return None
+
+    def _change_edge(self, u, v, weight, factor, duration, tightening):
+        """Record a change on a troncon segment, a contracted edge or a plain edge"""
+        if (u, v) in self.segment_edge:
+            expiry = self._push_expiry(duration, 'segment', (u, v))
+            self.segments[(u, v)] = self.segments[(v, u)] = (weight, factor, expiry)
+            self._repair(self.segment_edge[(u, v)])
+        elif self._chain_key(u, v) is not None:
+            expiry = self._push_expiry(duration, 'direct', (u, v))
+            self.direct[(u, v)] = self.direct[(v, u)] = (weight, factor, expiry)
+            self._repair(self._chain_key(u, v))
+        else:
+            self._set_edge(u, v, weight, factor, duration, tightening)
+
+    def _chain_weight(self, nodes, weights):
+        """Weight of a physical chain under the segment and junction changes"""
+        if any(node in self.junctions for node in nodes[1:-1]):
+            return float('inf')
+        total = 0
+        for a, b, weight in zip(nodes, nodes[1:], weights):
+            entry = self.segments.get((a, b))
+            if entry is not None:
+                weight = self._apply(entry, weight)
+                if weight is None:
+                    return float('inf')
+            total += weight
+        return total
+
+    def _repair(self, edge):
+        """Re-weight the contracted edge to its lightest open chain, then apply its direct change"""
+        u, v = edge
+        chains = self.chains[edge]
+        base = min(sum(weights) for _, weights in chains)
+        weight = min(self._chain_weight(nodes, weights) for nodes, weights in chains)
+        direct = self.direct.get(edge)
+        if direct is not None and weight != float('inf'):
+            weight = self._apply(direct, weight)
+            if weight is None:
+                weight = float('inf')
+        if weight == base:
+            self._clear_edge(u, v)
+        elif weight == float('inf'):
+            self._set_edge(u, v, None, None, None, tightening=True)
+        else:
+            self._set_edge(u, v, weight, None, None, tightening=weight > base)
+
+    def close_edge(self, u, v, duration=None):
+        """Close the edge (or physical troncon segment) between u and v"""
+        self._change_edge(u, v, None, None, duration, tightening=True)
+
+    def penalize_edge(self, u, v, factor, duration=None):
+        """Multiply the weight of the edge (or troncon segment) between u and v by factor"""
+        self._change_edge(u, v, None, factor, duration, tightening=factor >= 1)
+
+    def reweight_edge(self, u, v, weight, duration=None):
+        """Replace the weight of the edge (or troncon segment) between u and v"""
+        # Whether this is better or worse depends on the base weight, assume better
+        self._change_edge(u, v, weight, None, duration, tightening=False)
+
+    def reopen_edge(self, u, v):
+        """Remove any closure or weight change on the edge (or troncon segment) between u and v"""
+        if (u, v) in self.segment_edge:
+            changes, edge = self.segments, self.segment_edge[(u, v)]
+        elif self._chain_key(u, v) is not None:
+            changes, edge = self.direct, self._chain_key(u, v)
+        else:
+            self._clear_edge(u, v)
+            return
+        if changes.pop((u, v), None) is not None:
+            changes.pop((v, u), None)
+            self._repair(edge)
+
+    def close_station(self, code, duration=None):
+        """Close a station (or junction inside a troncons chain), no route may go through it"""
+        if code in self.node_edge:
+            self.junctions[code] = self._push_expiry(duration, 'junction', code)
+            self._repair(self.node_edge[code])
+            return
+        replaced = code in self.stations
+        self.stations[code] = self._push_expiry(duration, 'station', code)
+        if not replaced:
+            self._notify('tightened', station=code)
+
+    def reopen_station(self, code):
+        if code in self.junctions:
+            del self.junctions[code]
+            self._repair(self.node_edge[code])
+        elif code in self.stations:
+            del self.stations[code]
+            self._notify('relaxed', station=code)
+
+    def edge_weight(self, u, v, weight):
+        """Weight of the edge (u, v) of base weight weight, None if closed"""
+        entry = self.edges.get((u, v))
+        if entry is None:
+            return weight
+        return self._apply(entry, weight)
+
+    @staticmethod
+    def _apply(entry, weight):
+        new_weight, factor, _ = entry
+        if factor is not None:
+            return weight * factor
+        return new_weight
+
+    def expire(self, now=None):
+        """Drop the changes whose duration is over"""
+        if not self._expiries:
+            return
+        now = time.monotonic() if now is None else now
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, _, kind, key = heapq.heappop(self._expiries)
+            # Skip stale heap entries, the change was replaced or reopened since
+            if kind in ('edge', 'segment', 'direct'):
+                changes = {'edge': self.edges, 'segment': self.segments, 'direct': self.direct}[kind]
+                entry = changes.get(key)
+                if entry is not None and entry[2] == expiry:
+                    self.reopen_edge(*key)
+            else:
+                closures = self.stations if kind == 'station' else self.junctions
+                if key in closures and closures[key] == expiry:
+                    self.reopen_station(key)
+
+
+class RouteCache:
+    """Cache of dijkstra results kept consistent with a GraphOverlay
+
+    Each cached route remembers the nodes its search settled. A change on the
+    overlay only drops the routes it can affect:
+    - a closure or penalty drops the routes going through it
+    - a reopening or weight decrease on (u, v) drops the routes whose search
+      settled u or v, or a neighbor of a reopened station. Other searches
+      stopped before reaching them, so their result cannot improve.
+    """
+
+    def __init__(self, graph, overlay, max_routes=1024):
+        self.graph = graph
+        self.overlay = overlay
+        self.max_routes = max_routes
+        self._routes = OrderedDict()
+        # node -> keys of the routes whose search settled it
+        self._by_node = {}
+        overlay.subscribe(self)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def find(self, start, end):
+        """Shortest (path, distance) from start to end under the overlay"""
+        self.overlay.expire()
+        key = (start, end)
+        if key in self._routes:
+            self._routes.move_to_end(key)
+            path, distance, _ = self._routes[key]
+            return path, distance
+
+        visited = set()
+        path, distance = dijkstra(self.graph, start, end, self.overlay, visited)
+        # Not settled when dijkstra stops early on a closed start or end
+        visited.update((start, end))
+        self._routes[key] = (path, distance, visited)
+        for node in visited:
+            self._by_node.setdefault(node, set()).add(key)
+        if len(self._routes) > self.max_routes:
+            self._drop(next(iter(self._routes)))
+        return path, distance
+
+    def _drop(self, key):
+        _, _, visited = self._routes.pop(key)
+        for node in visited:
+            keys = self._by_node.get(node)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_node[node]
+
+    def _keys_settling(self, nodes):
+        keys = set()
+        for node in nodes:
+            keys |= self._by_node.get(node, set())
+        return keys
+
+    def tightened(self, edge=None, station=None):
+        if station is not None:
+            # Every node of a path was settled by its search
+            for key in self._keys_settling((station,)):
+                path = self._routes[key][0]
+                if path and station in path:
+                    self._drop(key)
+            return
+
+        u, v = edge
+        for key in self._keys_settling(edge):
+            path = self._routes[key][0]
+            if path and any({a, b} == {u, v} for a, b in zip(path, path[1:])):
+                self._drop(key)
+
+    def relaxed(self, edge=None, station=None):
+        if station is not None:
+            # A reopened station is reached from its neighbors
+            nodes = [station] + [neighbor for neighbor, _ in self.graph.get(station, ())]
+        else:
+            nodes = edge
+        for key in self._keys_settling(nodes):
+            self._drop(key)
+
+    def clear(self):
+        self._routes.clear()
+        self._by_node.clear()
@@ -1,6 +1,8 @@
 import heapq
 from math import radians, cos, sin, asin, sqrt
 from collections import defaultdict
+import troncons_graph
+from spatial_index import StationIndex
 
 def haversine(lat1, lon1, lat2, lon2):
     """
@@ -33,43 +35,93 @@ def parse_geo_point(geo_point_str):
     except ValueError:
         return None
 
-def build_graph(conn):
-    """Build graph from database"""
+def load_stations(conn):
+    """Load stations as {code_uic: {'name', 'coords'}}"""
     cursor = conn.cursor()
     
-    # Get all stations with their geo_points
-    cursor.execute("SELECT code_uic, libelle, geo_point FROM gares")
+    # Coordinates are stored as numbers at ingest, no geo_point parsing here
+    cursor.execute("SELECT code_uic, libelle, latitude, longitude FROM gares WHERE latitude IS NOT NULL")
     stations = {}
-    for code_uic, libelle, geo_point in cursor.fetchall():
-        coords = parse_geo_point(geo_point)
-        if coords:
-            stations[code_uic] = {
-                'name': libelle,
-                'coords': coords
-            }
+    for code_uic, libelle, lat, lon in cursor.fetchall():
+        stations[code_uic] = {
+            'name': libelle,
+            'coords': (lat, lon)
+        }
+    return stations
+
+# Weights each network can be built with, the first one is its default.
+# For 'lignes' they are the columns filled in by database_creator.
+NETWORK_WEIGHTS = {
+    "lignes": ("distance_km", "temps_min"),
+    "troncons": ("temps_min",),
+}
+WEIGHT_UNITS = {"distance_km": "km", "temps_min": "min"}
+
+def network_weight(network, weight=None):
+    """Check weight is valid for network, returns it (or the network's default)"""
+    if network not in NETWORK_WEIGHTS:
+        raise ValueError(f"Unknown network '{network}', expected one of {tuple(NETWORK_WEIGHTS)}")
+    if weight is None:
+        return NETWORK_WEIGHTS[network][0]
+    if weight not in NETWORK_WEIGHTS[network]:
+        raise ValueError(f"Unknown weight '{weight}' for network '{network}', "
+                         f"expected one of {NETWORK_WEIGHTS[network]}")
+    return weight
+
+def build_graph(conn, network="lignes", weight=None):
+    """Build graph from database
+
+    network="lignes" uses the O/D pairs from the fares, weighted by the
+    precomputed weight column (distance_km by default, or temps_min).
+    network="troncons" uses the physical track network, only weighted by
+    temps_min (travel times in minutes).
+    """
+    weight = network_weight(network, weight)
+    stations = load_stations(conn)
+    if network == "troncons":
+        return troncons_graph.build_troncons_graph(conn, stations), stations
+
+    # Named cursor: rows are streamed from the server instead of fetched at once
+    cursor = conn.cursor(name="build_graph_lignes")
+    cursor.itersize = 10000
+    cursor.execute(
+        f"SELECT gare_origine_code_uic, gare_destination_code_uic, {weight} "
+        f"FROM lignes WHERE {weight} IS NOT NULL"
+    )
     
     # Build adjacency list
     graph = defaultdict(list)
-    cursor.execute("SELECT gare_origine_code_uic, gare_destination_code_uic FROM lignes")
-    
-    for origine, destination in cursor.fetchall():
+    for origine, destination, distance in cursor:
         if origine in stations and destination in stations:
-            # Calculate distance
-            lat1, lon1 = stations[origine]['coords']
-            lat2, lon2 = stations[destination]['coords']
-            distance = haversine(lat1, lon1, lat2, lon2)
-            
             # Add bidirectional edges
             graph[origine].append((destination, distance))
             graph[destination].append((origine, distance))
+    cursor.close()
     
     return graph, stations
 
-def dijkstra(graph, start, end):
-    """Find shortest path using Dijkstra's algorithm"""
+def build_graph_and_index(conn, network="lignes", weight=None):
+    """Build the graph and a spatial index over its stations"""
+    graph, stations = build_graph(conn, network, weight)
+    return graph, stations, StationIndex.from_stations(stations)
+
+def dijkstra(graph, start, end, overlay=None, visited=None):
+    """Find shortest path using Dijkstra's algorithm
+
+    overlay is an optional GraphOverlay of closed or re-weighted edges and
+    stations. If visited is given, it is filled with the settled nodes.
+    """
+    closed_stations = overlay_edges = None
+    if overlay is not None:
+        overlay.expire()
+        closed_stations, overlay_edges = overlay.stations, overlay.edges
+        if start in closed_stations or end in closed_stations:
+            return None, None
+
     # Priority queue: (distance, current_node, path)
     pq = [(0, start, [start])]
-    visited = set()
+    if visited is None:
+        visited = set()
     distances = {start: 0}
     
     while pq:
@@ -85,6 +137,13 @@ def dijkstra(graph, start, end):
         
         for neighbor, weight in graph[current]:
             if neighbor not in visited:
+                # Empty overlays are falsy, so this costs nothing without disruptions
+                if overlay_edges and (current, neighbor) in overlay_edges:
+                    weight = overlay.edge_weight(current, neighbor, weight)
+                    if weight is None:
+                        continue
+                if closed_stations and neighbor in closed_stations:
+                    continue
                 new_dist = current_dist + weight
                 if neighbor not in distances or new_dist < distances[neighbor]:
                     distances[neighbor] = new_dist
@@ -107,52 +166,75 @@ def find_station_code(conn, station_name):
 
 
 
-def find_shortest_path(conn, start_name, end_name):
-    """Main function to find shortest path between two stations"""
-    # Find station codes
-    start_matches = find_station_code(conn, start_name)
-    end_matches = find_station_code(conn, end_name)
-    
-    if not start_matches:
-        print(f"No station found matching '{start_name}'")
-        return
-    if not end_matches:
-        print(f"No station found matching '{end_name}'")
-        return
-    
+def find_nearest_station(index, lat, lon):
+    """Nearest station to a point, as a (code_uic, libelle) pair, None if there is none"""
+    indices, _ = index.query_nearest(lat, lon, k=1)
+    if not indices.size or indices[0, 0] < 0:
+        return None
+    return index.stations_at(indices[0])[0]
+
+
+def resolve_station(conn, index, place):
+    """Resolve a place to a (code_uic, libelle) pair, None if nothing matches
+
+    place is either a (lat, lon) tuple, resolved to the nearest station, or a
+    name. Names use the partial match of find_station_code first and fall
+    back to the fuzzy match of the spatial index ('Marseile').
+    """
+    if isinstance(place, tuple):
+        return find_nearest_station(index, *place)
+
+    matches = find_station_code(conn, place)
+    if not matches:
+        i = index.match_name(place)
+        return index.stations_at([i])[0] if i is not None else None
+
     # Handle multiple matches
-    if len(start_matches) > 1:
-        print(f"\nMultiple stations found for '{start_name}':")
-        for i, (code, name) in enumerate(start_matches, 1):
-            print(f"{i}. {name} ({code})")
-        choice = int(input("Select station number: ")) - 1
-        start_code, start_libelle = start_matches[choice]
-    else:
-        start_code, start_libelle = start_matches[0]
-    
-    if len(end_matches) > 1:
-        print(f"\nMultiple stations found for '{end_name}':")
-        for i, (code, name) in enumerate(end_matches, 1):
+    if len(matches) > 1:
+        print(f"\nMultiple stations found for '{place}':")
+        for i, (code, name) in enumerate(matches, 1):
             print(f"{i}. {name} ({code})")
         choice = int(input("Select station number: ")) - 1
-        end_code, end_libelle = end_matches[choice]
-    else:
-        end_code, end_libelle = end_matches[0]
-    
-    # Build graph and find path
+        return matches[choice]
+    return matches[0]
+
+
+def find_shortest_path(conn, start, end, network="lignes", weight=None):
+    """Main function to find shortest path between two stations
+
+    start and end are station names (partial or misspelled) or (lat, lon) tuples.
+    network and weight are passed to build_graph.
+    """
+    weight = network_weight(network, weight)
+    # Build graph first, its spatial index resolves coordinates and fuzzy names
     print("\nBuilding graph...")
-    graph, stations = build_graph(conn)
+    graph, stations, index = build_graph_and_index(conn, network, weight)
+
+    start_match = resolve_station(conn, index, start)
+    if not start_match:
+        print(f"No station found matching '{start}'")
+        return
+    end_match = resolve_station(conn, index, end)
+    if not end_match:
+        print(f"No station found matching '{end}'")
+        return
+    start_code, start_libelle = start_match
+    end_code, end_libelle = end_match
     
     print(f"Finding shortest path from '{start_libelle}' to '{end_libelle}'...")
     path, distance = dijkstra(graph, start_code, end_code)
 
-    return_path = [stations[code]['name'] for code in path] if path else None
+    # Troncons junctions that are not passenger stations are left out
+    return_path = [stations[code]['name'] for code in path if code in stations] if path else None
     
     if path:
-        print(f"\n✓ Path found! Total distance: {distance:.2f} km")
-        print(f"\nRoute ({len(path)} stations):")
-        for i, code in enumerate(path, 1):
-            print(f"{i}. {stations[code]['name']}")
+        if WEIGHT_UNITS[weight] == "min":
+            print(f"\n✓ Path found! Total time: {distance:.0f} min")
+        else:
+            print(f"\n✓ Path found! Total distance: {distance:.2f} km")
+        print(f"\nRoute ({len(return_path)} stations):")
+        for i, name in enumerate(return_path, 1):
+            print(f"{i}. {name}")
         return return_path, distance
     else:
         print(f"\n✗ No path found between these stations")
@@ -0,0 +1,244 @@
+import heapq
+import json
+import multiprocessing
+import struct
+from array import array
+from multiprocessing import shared_memory
+
+# Header: 8 bytes of JSON length, then the JSON layout of the arrays
+HEADER_SIZE = struct.calcsize('<Q')
+
+
+def _encode_strings(strings):
+    """Concatenate strings as utf-8, returns (offsets, bytes)"""
+    offsets = array('q', [0])
+    data = bytearray()
+    for s in strings:
+        data += s.encode('utf-8')
+        offsets.append(len(data))
+    return offsets, data
+
+
+def _attach_memory(name):
+    """Attach an existing block without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks the block. Pool workers share the resource
+        # tracker of the process that created it, so it is only unlinked once.
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedGraph:
+    """Read-only CSR copy of a graph and its stations in one shared memory block
+
+    Nodes are sorted by code so lookups are a binary search, no per-process
+    dict is needed. Neighbors of node i are indices[indptr[i]:indptr[i + 1]]
+    with the matching weights. Every array is a read-only memoryview over the
+    block, so attaching from a worker process copies nothing.
+    Node codes are stored as str(node), nodes that are not stations (troncons
+    junctions) get an empty name, nan coordinates and is_station[i] == 0.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+
+        (header_size,) = struct.unpack_from('<Q', shm.buf, 0)
+        layout = json.loads(bytes(shm.buf[HEADER_SIZE:HEADER_SIZE + header_size]))
+        self.n_nodes = layout['n_nodes']
+
+        buf = shm.buf.toreadonly()
+        self._fields = list(layout['arrays'])
+        for field, (offset, nbytes, typecode) in layout['arrays'].items():
+            setattr(self, field, buf[offset:offset + nbytes].cast(typecode))
+
+    @classmethod
+    def create(cls, graph, stations, name=None):
+        """Copy graph and stations (as returned by build_graph) into shared memory"""
+        codes = sorted({str(u) for u in graph} | {str(v) for edges in graph.values() for v, _ in edges}
+                       | {str(code) for code in stations})
+        index = {code: i for i, code in enumerate(codes)}
+        by_code = {str(code): station for code, station in stations.items()}
+        edges_by_code = {str(u): edges for u, edges in graph.items()}
+
+        indptr = array('q', [0])
+        indices = array('i')
+        weights = array('d')
+        lats = array('d')
+        lons = array('d')
+        is_station = array('B', (code in by_code for code in codes))
+        for code in codes:
+            for v, w in edges_by_code.get(code, ()):
+                indices.append(index[str(v)])
+                weights.append(w)
+            indptr.append(len(indices))
+            lat, lon = by_code[code]['coords'] if code in by_code else (float('nan'), float('nan'))
+            lats.append(lat)
+            lons.append(lon)
+
+        code_offsets, code_bytes = _encode_strings(codes)
+        name_offsets, name_bytes = _encode_strings(by_code[code]['name'] if code in by_code else ''
+                                                   for code in codes)
+
+        arrays = {
+            'indptr': indptr, 'indices': indices, 'weights': weights,
+            'lats': lats, 'lons': lons, 'is_station': is_station,
+            'code_offsets': code_offsets, 'code_bytes': array('B', code_bytes),
+            'name_offsets': name_offsets, 'name_bytes': array('B', name_bytes),
+        }
+
+        # Lay the arrays out after the header, 8-byte aligned
+        layout = {'n_nodes': len(codes), 'arrays': {}}
+        offset = 4096
+        for field, arr in arrays.items():
+            nbytes = len(arr) * arr.itemsize
+            layout['arrays'][field] = (offset, nbytes, arr.typecode)
+            offset += (nbytes + 7) // 8 * 8
+        header = json.dumps(layout).encode('utf-8')
+        if HEADER_SIZE + len(header) > 4096:
+            raise ValueError("Shared graph header does not fit in its 4096 bytes")
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+        struct.pack_into('<Q', shm.buf, 0, len(header))
+        shm.buf[HEADER_SIZE:HEADER_SIZE + len(header)] = header
+        for field, arr in arrays.items():
+            start, nbytes, _ = layout['arrays'][field]
+            shm.buf[start:start + nbytes] = arr.tobytes()
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to a graph created by another process"""
+        return cls(_attach_memory(name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def close(self):
+        """Release the views, and remove the block if this process created it"""
+        for field in self._fields:
+            getattr(self, field).release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def code(self, i):
+        return bytes(self.code_bytes[self.code_offsets[i]:self.code_offsets[i + 1]]).decode('utf-8')
+
+    def station_name(self, i):
+        return bytes(self.name_bytes[self.name_offsets[i]:self.name_offsets[i + 1]]).decode('utf-8')
+
+    def coords(self, i):
+        return self.lats[i], self.lons[i]
+
+    def index_of(self, code):
+        """Index of the node with this code, None if absent"""
+        code = str(code)
+        lo, hi = 0, self.n_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.code(mid) < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_nodes and self.code(lo) == code else None
+
+    def neighbors(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return zip(self.indices[start:end], self.weights[start:end])
+
+    def dijkstra(self, start, end):
+        """Same as pathfinding.dijkstra on node indices, returns (path, distance)"""
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        pq = [(0, start)]
+        distances = {start: 0}
+        previous = {}
+        visited = set()
+
+        while pq:
+            current_dist, current = heapq.heappop(pq)
+            if current in visited:
+                continue
+            visited.add(current)
+
+            if current == end:
+                path = [end]
+                while path[-1] != start:
+                    path.append(previous[path[-1]])
+                return path[::-1], current_dist
+
+            for k in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[k]
+                if neighbor not in visited:
+                    new_dist = current_dist + weights[k]
+                    if neighbor not in distances or new_dist < distances[neighbor]:
+                        distances[neighbor] = new_dist
+                        previous[neighbor] = current
+                        heapq.heappush(pq, (new_dist, neighbor))
+
+        return None, None
+
+    def find_path(self, start_code, end_code):
+        """Shortest path between two codes, returns (station codes, distance)
+
+        Like find_shortest_path, troncons junctions that are not stations are
+        left out of the returned path.
+        """
+        start, end = self.index_of(start_code), self.index_of(end_code)
+        if start is None or end is None:
+            return None, None
+        path, distance = self.dijkstra(start, end)
+        if path is None:
+            return None, None
+        return [self.code(i) for i in path if self.is_station[i]], distance
+
+
+# Graph attached by each worker of a QueryExecutor
+_worker_graph = None
+
+
+def _attach_worker(name):
+    global _worker_graph
+    _worker_graph = SharedGraph.attach(name)
+
+
+def _find_path_worker(pair):
+    return _worker_graph.find_path(*pair)
+
+
+class QueryExecutor:
+    """Process pool answering route queries on a SharedGraph
+
+    Workers attach the shared block once at startup, so memory does not grow
+    with the graph size times the number of workers.
+    """
+
+    def __init__(self, shared_graph, processes=None):
+        self.pool = multiprocessing.Pool(processes, initializer=_attach_worker,
+                                         initargs=(shared_graph.name,))
+
+    def find_paths(self, pairs, chunksize=16):
+        """(station codes, distance) for each (start_code, end_code) pair, in order"""
+        return self.pool.map(_find_path_worker, pairs, chunksize)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,181 @@
+import difflib
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+# Past half the Earth's circumference (plus rounding slack) a radius covers the whole globe
+MAX_RADIUS_KM = np.pi * EARTH_RADIUS_KM + 1
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Vectorized haversine, arguments in decimal degrees, result in km"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StationIndex:
+    """Grid bucket index over station coordinates
+
+    Stations are sorted by grid cell (cell_size degrees) so every row of
+    cells covered by a query is one contiguous slice of the coordinate
+    arrays. Candidates are then filtered with an exact haversine.
+    Longitudes do not wrap around the antimeridian, which is fine for France.
+    """
+
+    def __init__(self, codes, names, lats, lons, cell_size=0.25):
+        self.cell_size = cell_size
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        if len(lats):
+            self.lat_min, self.lon_min = lats.min(), lons.min()
+            self.n_rows = int((lats.max() - self.lat_min) // cell_size) + 1
+            self.n_cols = int((lons.max() - self.lon_min) // cell_size) + 1
+        else:
+            # No station with coordinates: a single empty cell, every query finds nothing
+            self.lat_min = self.lon_min = 0.0
+            self.n_rows = self.n_cols = 1
+
+        rows, cols = self._cell(lats, lons)
+        cells = rows * self.n_cols + cols
+        order = np.argsort(cells, kind='stable')
+
+        self.codes = np.asarray(codes, dtype=object)[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        # cell_start[c]:cell_start[c + 1] is the slice of stations in cell c
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.n_rows * self.n_cols + 1))
+
+    @classmethod
+    def from_stations(cls, stations, cell_size=0.25):
+        """Build the index from the stations dict returned by build_graph"""
+        codes = list(stations)
+        names = [stations[code]['name'] for code in codes]
+        lats = [stations[code]['coords'][0] for code in codes]
+        lons = [stations[code]['coords'][1] for code in codes]
+        return cls(codes, names, lats, lons, cell_size)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _cell(self, lats, lons):
+        rows = np.clip(((lats - self.lat_min) // self.cell_size).astype(np.int64), 0, self.n_rows - 1)
+        cols = np.clip(((lons - self.lon_min) // self.cell_size).astype(np.int64), 0, self.n_cols - 1)
+        return rows, cols
+
+    def _radius_batch(self, lats, lons, radii):
+        """Stations within radii[q] of each query point q, all queries at once
+
+        Each query covers the cell rows of its radius bounding box, every row
+        being one contiguous slice. The slices of all queries are expanded into
+        one flat array of (query, candidate) pairs, filtered with a single
+        haversine call. Returns (queries, candidates, distances), sorted by
+        query then distance. Queries with a non-finite point find nothing.
+        """
+        finite = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        if len(finite) < len(lats):
+            queries, candidates, distances = self._radius_batch(lats[finite], lons[finite], radii[finite])
+            return finite[queries], candidates, distances
+
+        dlat = radii / KM_PER_DEGREE
+        cos_lat = np.maximum(np.cos(np.radians(np.minimum(np.abs(lats) + dlat, 89.0))), 1e-6)
+        dlon = dlat / cos_lat
+
+        r0, c0 = self._cell(lats - dlat, lons - dlon)
+        r1, c1 = self._cell(lats + dlat, lons + dlon)
+
+        # One slice per (query, covered row), rows past r1 get an empty slice
+        rows = r0[:, None] + np.arange((r1 - r0).max(initial=0) + 1)
+        valid = rows <= r1[:, None]
+        rows = np.minimum(rows, self.n_rows - 1)
+        starts = self.cell_start[rows * self.n_cols + c0[:, None]]
+        ends = self.cell_start[rows * self.n_cols + c1[:, None] + 1]
+        lengths = np.where(valid, ends - starts, 0).ravel()
+
+        queries = np.repeat(np.repeat(np.arange(len(lats)), rows.shape[1]), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        candidates = np.arange(lengths.sum()) + np.repeat(starts.ravel() - offsets, lengths)
+
+        distances = haversine_np(lats[queries], lons[queries], self.lats[candidates], self.lons[candidates])
+        inside = distances <= radii[queries]
+        queries, candidates, distances = queries[inside], candidates[inside], distances[inside]
+        order = np.lexsort((distances, queries))
+        return queries[order], candidates[order], distances[order]
+
+    @staticmethod
+    def _as_points(lats, lons):
+        return np.atleast_1d(lats).astype(np.float64), np.atleast_1d(lons).astype(np.float64)
+
+    def query_radius(self, lats, lons, radius_km):
+        """Stations within radius_km of each query point, sorted by distance
+
+        Returns one (indices, distances) pair per query point.
+        """
+        lats, lons = self._as_points(lats, lons)
+        queries, candidates, distances = self._radius_batch(lats, lons, np.full(len(lats), float(radius_km)))
+        bounds = np.cumsum(np.bincount(queries, minlength=len(lats)))[:-1]
+        return list(zip(np.split(candidates, bounds), np.split(distances, bounds)))
+
+    def query_nearest(self, lats, lons, k=1):
+        """The k nearest stations of each query point
+
+        Returns (indices, distances) arrays of shape (n_queries, k). All
+        pending queries run as one radius batch, the radius of those that
+        found fewer than k stations is doubled for the next round. Once a
+        radius holds k stations, its k closest are the exact nearest.
+        Query points with a nan or infinite coordinate get index -1 and an
+        infinite distance.
+        """
+        lats, lons = self._as_points(lats, lons)
+        k = min(k, len(self))
+        indices = np.full((len(lats), k), -1, dtype=np.int64)
+        distances = np.full((len(lats), k), np.inf)
+
+        # Non-finite points would never find k stations, whatever the radius
+        pending = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons)) if k else np.empty(0, dtype=np.int64)
+        radii = np.full(len(lats), self.cell_size * KM_PER_DEGREE)
+        while len(pending):
+            queries, candidates, dists = self._radius_batch(lats[pending], lons[pending], radii[pending])
+            counts = np.bincount(queries, minlength=len(pending))
+            first = np.cumsum(counts) - counts
+            done = counts >= k
+
+            # Rank of each result within its query, keep the first k of finished queries
+            rank = np.arange(len(queries)) - first[queries]
+            keep = done[queries] & (rank < k)
+            indices[pending[queries[keep]], rank[keep]] = candidates[keep]
+            distances[pending[queries[keep]], rank[keep]] = dists[keep]
+
+            pending = pending[~done]
+            # Capped radii hold every station, so each query ends at the latest there
+            radii[pending] = np.minimum(radii[pending] * 2, MAX_RADIUS_KM)
+        return indices, distances
+
+    def match_name(self, place_name, cutoff=0.6):
+        """Index of the station whose name best matches place_name, None if none does"""
+        lowered = place_name.lower()
+        # Same partial match as find_station_code first, then a fuzzy one
+        for i, name in enumerate(self.names):
+            if lowered in name.lower():
+                return i
+        # Match on the full name and on the city part ('Marseille' in 'Marseille-St-Charles')
+        keys = {}
+        for i, name in enumerate(self.names):
+            name = name.lower()
+            keys.setdefault(name, i)
+            keys.setdefault(name.replace(' ', '-').split('-')[0], i)
+        matches = difflib.get_close_matches(lowered, list(keys), n=1, cutoff=cutoff)
+        return keys[matches[0]] if matches else None
+
+    def near_name(self, place_name, radius_km):
+        """Stations within radius_km of the station matching place_name"""
+        i = self.match_name(place_name)
+        if i is None:
+            return None, None
+        return self.query_radius(self.lats[i], self.lons[i], radius_km)[0]
+
+    def stations_at(self, indices):
+        """Map index results back to (code_uic, name) pairs"""
+        return [(self.codes[i], self.names[i]) for i in np.ravel(indices)]
@@ -0,0 +1,252 @@
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+
+# Used when a troncon has no usable max speed (km/h)
+DEFAULT_SPEED = 100.0
+
+
+def parse_pk(pk_str):
+    """Parse a PK string ('602+834') to kilometers (602.834)"""
+    if not pk_str:
+        return None
+    pk_str = pk_str.strip()
+    sign = -1 if pk_str.startswith('-') else 1
+    pk_str = pk_str.lstrip('+-')
+    try:
+        if '+' in pk_str:
+            km, m = pk_str.split('+', 1)
+            return sign * (float(km) + float(m) / 1000)
+        return sign * float(pk_str.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def format_pk(pk):
+    """Format kilometers (602.834) back to a PK string ('602+834')"""
+    meters = round(abs(pk) * 1000)
+    sign = '-' if pk < 0 and meters else ''
+    return f"{sign}{meters // 1000}+{meters % 1000:03d}"
+
+
+def parse_float(value):
+    """Parse a numeric TEXT column, None if empty or invalid"""
+    if value is None:
+        return None
+    try:
+        return float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def section_key(code_ligne, rg_troncon):
+    """Key of one PK axis: a line may have several sections that reuse the same PKs"""
+    return code_ligne, (rg_troncon or '').strip()
+
+
+def load_troncons(conn):
+    """Load troncons as {(code_ligne, rg_troncon): sorted list of (pkd, pkf, minutes_per_km)}"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT code_ligne, rg_troncon, pkd, pkf, v_max, temps_trajet FROM troncons")
+
+    troncons = defaultdict(list)
+    for code_ligne, rg_troncon, pkd, pkf, v_max, temps_trajet in cursor.fetchall():
+        start, end = parse_pk(pkd), parse_pk(pkf)
+        if start is None or end is None or start == end:
+            continue
+        if start > end:
+            start, end = end, start
+
+        # Prefer the stored travel time, otherwise derive it from the speed limit
+        minutes = parse_float(temps_trajet)
+        if minutes is not None and minutes > 0:
+            minutes_per_km = minutes / (end - start)
+        else:
+            speed = parse_float(v_max)
+            if not speed or speed <= 0:
+                speed = DEFAULT_SPEED
+            minutes_per_km = 60 / speed
+
+        troncons[section_key(code_ligne, rg_troncon)].append((start, end, minutes_per_km))
+
+    for segments in troncons.values():
+        segments.sort()
+    return troncons
+
+
+def load_station_positions(conn):
+    """Load station positions as {(code_ligne, rg_troncon): list of (pk, code_uic)}"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT code_uic, code_ligne, rg_troncon, pk FROM gares_lignes")
+
+    positions = defaultdict(list)
+    for code_uic, code_ligne, rg_troncon, pk in cursor.fetchall():
+        pk = parse_pk(pk)
+        if pk is not None:
+            positions[section_key(code_ligne, rg_troncon)].append((pk, code_uic))
+    return positions
+
+
+def _minutes_per_km_at(segments, starts, pk):
+    """Return the pace of the troncon covering pk, None if pk is in a gap"""
+    # Troncons of one section may overlap, look back for one that still covers pk
+    for i in range(bisect_right(starts, pk) - 1, -1, -1):
+        _, end, minutes_per_km = segments[i]
+        if end >= pk:
+            return minutes_per_km
+    return None
+
+
+def build_physical_graph(troncons, positions):
+    """Build the uncontracted track graph, weights are travel times in minutes
+
+    Each (code_ligne, rg_troncon) section is its own PK axis, so sections of
+    a line that reuse the same PK range are never linked to each other.
+    Stations are snapped onto their section at their PK. A station served by
+    several sections is the same node on each of them, which links them.
+    Troncon boundaries without a station become nodes keyed
+    (code_ligne, rg_troncon, pk).
+    """
+    graph = defaultdict(list)
+
+    for section, segments in troncons.items():
+        starts = [start for start, _, _ in segments]
+
+        nodes_at = {}
+        for start, end, _ in segments:
+            nodes_at.setdefault(start, (*section, start))
+            nodes_at.setdefault(end, (*section, end))
+        for pk, code_uic in positions.get(section, []):
+            # Stations win over plain troncon boundaries at the same PK
+            if not isinstance(nodes_at.get(pk), str):
+                nodes_at[pk] = code_uic
+
+        pks = sorted(nodes_at)
+        for a, b in zip(pks, pks[1:]):
+            minutes_per_km = _minutes_per_km_at(segments, starts, (a + b) / 2)
+            if minutes_per_km is None:
+                continue
+            u, v = nodes_at[a], nodes_at[b]
+            if u == v:
+                continue
+            minutes = (b - a) * minutes_per_km
+            graph[u].append((v, minutes))
+            graph[v].append((u, minutes))
+
+    return graph
+
+
+class ContractedGraph(defaultdict):
+    """Contracted graph that remembers the physical troncons behind each edge
+
+    chains[(u, v)] lists every chain of the physical graph between the kept
+    nodes u and v as (nodes, weights), nodes running from u to v. The
+    contracted edge weighs as much as its lightest chain. segment_edge maps
+    each physical segment (both directions), and node_edge each inner node
+    of a chain, to the (u, v) key of its chain. GraphOverlay uses them to
+    close or penalise a single troncon.
+    """
+
+    def __init__(self, default_factory=list):
+        super().__init__(default_factory)
+        self.chains = {}
+        self.segment_edge = {}
+        self.node_edge = {}
+
+    def add_chain(self, nodes, weights):
+        u, v = nodes[0], nodes[-1]
+        key = (v, u) if (v, u) in self.chains else (u, v)
+        self.chains.setdefault(key, []).append((tuple(nodes), tuple(weights)))
+        for a, b in zip(nodes, nodes[1:]):
+            self.segment_edge[(a, b)] = self.segment_edge[(b, a)] = key
+        for node in nodes[1:-1]:
+            self.node_edge[node] = key
+
+
+def contract_graph(graph, keep):
+    """Contract chains of degree-2 nodes into single weighted edges
+
+    Nodes in keep (the stations) are never removed. Dead-end branches that
+    lead to no kept node are pruned first, since no route can use them.
+    Returns a ContractedGraph, with the same {node: [(neighbor, weight)]}
+    layout as the input.
+    """
+    neighbors = {u: {} for u in graph}
+    for u, edges in graph.items():
+        for v, w in edges:
+            # Keep the lightest of parallel edges
+            if v != u and (v not in neighbors[u] or w < neighbors[u][v]):
+                neighbors[u][v] = w
+                neighbors.setdefault(v, {})[u] = w
+
+    # Prune dead ends that are not stations
+    stack = [u for u, nbrs in neighbors.items() if len(nbrs) <= 1 and u not in keep]
+    while stack:
+        u = stack.pop()
+        if u not in neighbors:
+            continue
+        for v in neighbors.pop(u):
+            del neighbors[v][u]
+            if len(neighbors[v]) <= 1 and v not in keep:
+                stack.append(v)
+
+    def is_anchor(u):
+        return u in keep or len(neighbors[u]) != 2
+
+    contracted = ContractedGraph()
+    # First segment of every chain walked, each chain is walked from both ends
+    walked = set()
+    for u, nbrs in neighbors.items():
+        if not is_anchor(u):
+            continue
+        best = {}
+        for v, weight in nbrs.items():
+            nodes, weights = [u, v], [weight]
+            # Walk along the chain until the next anchor
+            while not is_anchor(v):
+                a, b = neighbors[v]
+                nxt = b if a == nodes[-2] else a
+                weights.append(neighbors[v][nxt])
+                weight += weights[-1]
+                v = nxt
+                nodes.append(v)
+            if v == u:
+                continue
+            if (v, nodes[-2]) not in walked:
+                contracted.add_chain(nodes, weights)
+            walked.add((u, nodes[1]))
+            if v not in best or weight < best[v]:
+                best[v] = weight
+        contracted[u] = list(best.items())
+
+    return contracted
+
+
+def shortest_times(graph, source, targets):
+    """Dijkstra from source, stops once every target is settled
+
+    Returns {node: weight} for the settled nodes.
+    """
+    remaining = set(targets)
+    settled = {}
+    pq = [(0, source)]
+    while pq and remaining:
+        current_dist, current = heapq.heappop(pq)
+        if current in settled:
+            continue
+        settled[current] = current_dist
+        remaining.discard(current)
+        for neighbor, weight in graph.get(current, ()):
+            if neighbor not in settled:
+                heapq.heappush(pq, (current_dist + weight, neighbor))
+    return settled
+
+
+def build_troncons_graph(conn, stations):
+    """Build the contracted physical network graph from troncons
+
+    stations is the dict from pathfinding.load_stations, those nodes are kept
+    by the contraction. Edge weights are travel times in minutes.
+    """
+    graph = build_physical_graph(load_troncons(conn), load_station_positions(conn))
+    return contract_graph(graph, set(stations))
@@ -4,9 +4,16 @@ import os
 import csv
 import json
 import math
+import sys
+from collections import defaultdict
 
 script_dir = os.path.dirname(__file__)
 
+# Reuse the parsing and graph helpers of the application
+sys.path.insert(0, os.path.join(script_dir, "..", "application"))
+from pathfinding import haversine, parse_geo_point
+import troncons_graph
+
 # Increase CSV field size limit to handle large geo shape fields
 csv.field_size_limit(10000000)  # Set to 10MB
 
@@ -104,14 +111,26 @@ def create_gares_table():
         
         if 'voyageurs' in headers:
             voyageurs_index = headers.index('voyageurs')
-            data_rows = [row for row in data_rows if row[voyageurs_index].upper() == 'O']
+            data_rows = [row for row in data_rows
+                         if len(row) > voyageurs_index and row[voyageurs_index].upper() == 'O']
             headers.pop(voyageurs_index)
             data_rows = [row[:voyageurs_index] + row[voyageurs_index+1:] for row in data_rows]
+
+        # Store coordinates as numbers so loading the graph does not parse geo_point
+        if 'geo_point' in headers:
+            geo_point_index = headers.index('geo_point')
+            # Pad short rows so the coordinates land in their own columns
+            data_rows = [row + [None] * (len(headers) - len(row)) for row in data_rows]
+            headers += ['latitude', 'longitude']
+            data_rows = [row + list(parse_geo_point(row[geo_point_index]) or (None, None))
+                         for row in data_rows]
                 
         column_defs_list = []
         for header in headers:
             if header == 'code_uic':
                 column_defs_list.append(f'"{header}" VARCHAR(10) UNIQUE')
+            elif header in ('latitude', 'longitude'):
+                column_defs_list.append(f'"{header}" DOUBLE PRECISION')
             else:
                 column_defs_list.append(f'"{header}" TEXT')
         columns_def = ", ".join(column_defs_list)
@@ -163,6 +182,117 @@ def create_gares_table():
     except Exception as e:
         print(f"Unexpected error: {e}")
 
+def create_gares_lignes_table():
+    """Store every (station, line, PK) position, used to snap stations onto troncons.
+
+    The 'gares' table keeps one row per code_uic, so a station served by
+    several lines only remembers one of them. This table keeps all of them,
+    which is what connects the lines together in the physical network.
+    """
+    print("Starting create_gares_lignes_table...")
+    conn = db_connect()
+    if not conn:
+        print("Failed to connect to database for create_gares_lignes_table.")
+        return
+
+    try:
+        with open(gares_csv_path, 'r', encoding='utf-8-sig') as f:
+            reader = csv.reader(f, delimiter=';')
+            headers = next(reader)
+            data_rows = list(reader)
+
+        headers = [h.lower().strip().replace(' ', '_') for h in headers]
+        try:
+            code_uic_index = headers.index('code_uic')
+            code_ligne_index = headers.index('code_ligne')
+            rg_troncon_index = headers.index('rg_troncon')
+            pk_index = headers.index('pk')
+        except ValueError as e:
+            print(f"Error: Missing expected column in CSV: {e}")
+            return
+
+        positions = set()
+        for row in data_rows:
+            if len(row) > max(code_uic_index, code_ligne_index, rg_troncon_index, pk_index):
+                code_uic = row[code_uic_index]
+                code_ligne = row[code_ligne_index]
+                pk = row[pk_index]
+                if code_uic and code_ligne and pk:
+                    # Empty rather than NULL, NULLs never conflict in the UNIQUE key
+                    positions.add((code_uic, code_ligne, row[rg_troncon_index].strip(), pk))
+
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        cur.execute("DROP TABLE IF EXISTS gares_lignes CASCADE;")
+        print("Dropped table 'gares_lignes' if it existed.")
+
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS gares_lignes (
+            id SERIAL PRIMARY KEY,
+            code_uic VARCHAR(10) NOT NULL,
+            code_ligne TEXT NOT NULL,
+            rg_troncon TEXT NOT NULL DEFAULT '',
+            pk TEXT NOT NULL,
+            UNIQUE (code_uic, code_ligne, rg_troncon, pk)
+        )
+        """
+        cur.execute(create_table_query)
+        print("Table 'gares_lignes' created successfully.")
+
+        insert_query = """
+        INSERT INTO gares_lignes (code_uic, code_ligne, rg_troncon, pk)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (code_uic, code_ligne, rg_troncon, pk) DO NOTHING;
+        """
+
+        inserted_count = 0
+        for position in positions:
+            try:
+                cur.execute(insert_query, position)
+                inserted_count += 1
+            except psycopg2.Error as e:
+                print(f"Error inserting position {position}: {e}")
+                continue
+
+        print(f"Inserted {inserted_count} rows into 'gares_lignes' table.")
+
+        cur.close()
+        conn.close()
+        print("Finished create_gares_lignes_table.")
+
+    except FileNotFoundError:
+        print(f"Error: CSV file not found at {gares_csv_path}")
+    except psycopg2.Error as e:
+        print(f"Error creating or inserting into 'gares_lignes' table: {e}")
+    except Exception as e:
+        print(f"Unexpected error in create_gares_lignes_table: {e}")
+
+def lignes_temps(conn, lignes):
+    """Travel time in minutes over the troncons network for each (origine, destination)
+
+    Lignes whose stations are not connected by troncons are left out. Returns
+    an empty dict when the 'troncons' table has not been created yet.
+    """
+    stations = {code for ligne in lignes for code in ligne}
+    try:
+        graph = troncons_graph.build_troncons_graph(conn, stations)
+    except psycopg2.Error as e:
+        print(f"Could not build the troncons graph, lignes will have no travel time: {e}")
+        return {}
+
+    destinations = defaultdict(set)
+    for origine, destination in lignes:
+        destinations[origine].add(destination)
+
+    temps = {}
+    for origine, targets in destinations.items():
+        times = troncons_graph.shortest_times(graph, origine, targets)
+        for destination in targets:
+            if destination in times:
+                temps[(origine, destination)] = times[destination]
+    return temps
+
 def create_lignes_table():
     print("Starting create_lignes_table...")
     conn = db_connect()
@@ -196,6 +326,12 @@ def create_lignes_table():
         conn.autocommit = True
         cur = conn.cursor()
 
+        # Edge weights are computed once here instead of on every graph load
+        cur.execute("SELECT code_uic, latitude, longitude FROM gares WHERE latitude IS NOT NULL")
+        coords = {code_uic: (lat, lon) for code_uic, lat, lon in cur.fetchall()}
+        temps = lignes_temps(conn, unique_lignes)
+        print(f"Travel time found on troncons for {len(temps)} of {len(unique_lignes)} lignes.")
+
         cur.execute("DROP TABLE IF EXISTS lignes CASCADE;")
         print("Dropped table 'lignes' if it existed.")
 
@@ -204,6 +340,8 @@ def create_lignes_table():
             id SERIAL PRIMARY KEY,
             gare_origine_code_uic VARCHAR(10) NOT NULL,
             gare_destination_code_uic VARCHAR(10) NOT NULL,
+            distance_km DOUBLE PRECISION,
+            temps_min DOUBLE PRECISION,
             UNIQUE (gare_origine_code_uic, gare_destination_code_uic)
         )
         """
@@ -211,15 +349,18 @@ def create_lignes_table():
         print("Table 'lignes' created successfully.")
 
         insert_query = """
-        INSERT INTO lignes (gare_origine_code_uic, gare_destination_code_uic)
-        VALUES (%s, %s)
+        INSERT INTO lignes (gare_origine_code_uic, gare_destination_code_uic, distance_km, temps_min)
+        VALUES (%s, %s, %s, %s)
         ON CONFLICT (gare_origine_code_uic, gare_destination_code_uic) DO NOTHING;
         """
         
         inserted_count = 0
         for gare1_uic, gare2_uic in unique_lignes:
+            distance = None
+            if gare1_uic in coords and gare2_uic in coords:
+                distance = haversine(*coords[gare1_uic], *coords[gare2_uic])
             try:
-                cur.execute(insert_query, (gare1_uic, gare2_uic))
+                cur.execute(insert_query, (gare1_uic, gare2_uic, distance, temps.get((gare1_uic, gare2_uic))))
                 inserted_count += 1
             except psycopg2.Error as e:
                 print(f"Error inserting ligne ({gare1_uic}, {gare2_uic}): {e}")
@@ -238,6 +379,50 @@ def create_lignes_table():
     except Exception as e:
         print(f"Unexpected error in create_lignes_table: {e}")
 
+def troncon_temps_trajet(data_dict):
+    """Travel time in minutes over a troncon at its max speed, None if unknown"""
+    pkd = troncons_graph.parse_pk(data_dict.get('pkd'))
+    pkf = troncons_graph.parse_pk(data_dict.get('pkf'))
+    v_max = troncons_graph.parse_float(data_dict.get('v_max'))
+    if pkd is None or pkf is None or not v_max or v_max <= 0:
+        return None
+    return abs(pkf - pkd) / v_max * 60
+
+def split_troncon(data_dict, speed_rows):
+    """Split a troncon where its max speed changes, returns one dict per piece
+
+    speed_rows are the (start, end, row dict) speed limits of the troncon's
+    (code_ligne, rg_troncon) section. Each piece takes the lowest v_max of
+    the speed rows covering it and gets its own pkd/pkf. A troncon without
+    usable PKs or speed rows is returned unchanged.
+    """
+    start = troncons_graph.parse_pk(data_dict.get('pkd'))
+    end = troncons_graph.parse_pk(data_dict.get('pkf'))
+    if start is None or end is None or start == end:
+        return [data_dict]
+    start, end = min(start, end), max(start, end)
+
+    overlapping = [(s, e, row) for s, e, row in speed_rows if s < end and e > start]
+    if not overlapping:
+        return [data_dict]
+
+    cuts = sorted({start, end} | {pk for s, e, _ in overlapping for pk in (s, e) if start < pk < end})
+    pieces = []
+    for a, b in zip(cuts, cuts[1:]):
+        middle = (a + b) / 2
+        covering = [row for s, e, row in overlapping if s <= middle <= e]
+        piece = dict(data_dict)
+        if covering:
+            slowest = min(covering, key=lambda row: troncons_graph.parse_float(row.get('v_max')) or float('inf'))
+            for header, value in slowest.items():
+                # Troncon columns win, speed rows only fill what is missing
+                if header not in data_dict or not data_dict[header]:
+                    piece[header] = value
+        if len(cuts) > 2:
+            piece['pkd'], piece['pkf'] = troncons_graph.format_pk(a), troncons_graph.format_pk(b)
+        pieces.append(piece)
+    return pieces
+
 def create_troncons_table():
     print("Starting create_troncons_table...")
     conn = db_connect()
@@ -289,7 +474,8 @@ def create_troncons_table():
         
         all_headers.append("temps_trajet")
         
-        columns = ", ".join([f'"{header}" TEXT' for header in all_headers])
+        columns = ", ".join([f'"{header}" DOUBLE PRECISION' if header == "temps_trajet" else f'"{header}" TEXT'
+                             for header in all_headers])
         
         conn = db_connect()
         if not conn:
@@ -317,15 +503,26 @@ def create_troncons_table():
                 key = f"{row[headers_troncons.index('code_ligne')]}_{row[headers_troncons.index('rg_troncon')]}_{row[headers_troncons.index('pkd')]}_{row[headers_troncons.index('pkf')]}"
                 merged_data[key] = dict(zip(headers_troncons, row))
         
+        # Speed limits by (code_ligne, rg_troncon) section, matched on their PK range
+        speeds = defaultdict(list)
         for row in data_speed:
             if len(row) >= len(headers_speed):
-                code_ligne_value = row[headers_speed.index('code_ligne')]
-                
-                for key, data_dict in merged_data.items():
-                    if data_dict.get('code_ligne') == code_ligne_value:
-                        for i, header in enumerate(headers_speed):
-                            if header not in data_dict or not data_dict[header]:
-                                data_dict[header] = row[i]
+                speed_dict = dict(zip(headers_speed, row))
+                start = troncons_graph.parse_pk(speed_dict.get('pkd'))
+                end = troncons_graph.parse_pk(speed_dict.get('pkf'))
+                if start is None or end is None:
+                    continue
+                section = troncons_graph.section_key(speed_dict.get('code_ligne'), speed_dict.get('rg_troncon'))
+                speeds[section].append((min(start, end), max(start, end), speed_dict))
+
+        # A troncon crossing several speed limits is split, one row per limit
+        split_data = {}
+        for data_dict in merged_data.values():
+            section = troncons_graph.section_key(data_dict.get('code_ligne'), data_dict.get('rg_troncon'))
+            for piece in split_troncon(data_dict, speeds.get(section, [])):
+                key = f"{piece.get('code_ligne')}_{piece.get('rg_troncon')}_{piece.get('pkd')}_{piece.get('pkf')}"
+                split_data.setdefault(key, piece)
+        merged_data = split_data
         
         placeholders = ", ".join(["%s"] * len(all_headers))
         column_names = ", ".join([f'"{header}"' for header in all_headers])
@@ -337,6 +534,7 @@ def create_troncons_table():
         
         inserted_count = 0
         for key, data_dict in merged_data.items():
+            data_dict["temps_trajet"] = troncon_temps_trajet(data_dict)
             try:
                 row_data = [data_dict.get(header, None) for header in all_headers]
                 cur.execute(insert_query, row_data)
@@ -351,7 +549,7 @@ def create_troncons_table():
         conn.close()
         print("Finished create_troncons_table.")
 
-    except FileNotFoundError:
+    except FileNotFoundError as e:
         print(f"Error: CSV file not found - {e}")
     except psycopg2.Error as e:
         print(f"Error creating table: {e}")
@@ -362,5 +560,6 @@ def create_troncons_table():
 if __name__ == "__main__":
     create_database()
     create_gares_table()
-    create_lignes_table()
-    create_troncons_table()
\ No newline at end of file
+    create_gares_lignes_table()
+    create_troncons_table()
+    create_lignes_table()
\ No newline at end of file
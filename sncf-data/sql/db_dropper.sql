@@ -1,2 +1,3 @@
 drop table gares cascade;
-drop table lignes cascade;
\ No newline at end of file
+drop table lignes cascade;
+drop table gares_lignes cascade;
\ No newline at end of file